@@ -3,7 +3,7 @@ SPDX-FileCopyrightText: © Sebastian Thomschke and contributors
 SPDX-License-Identifier: AGPL-3.0-or-later
 SPDX-ArtifactOfProjectHomePage: https://github.com/Second-Hand-Friends/kleinanzeigen-bot/
 """
-import ctypes, gettext, inspect, locale, logging, os, sys
+import ctypes, functools, gettext, inspect, locale, logging, os, sys
 from collections.abc import Sized
 from typing import Any, Final, NamedTuple
 
@@ -15,7 +15,8 @@ __all__ = [
     "get_current_locale",
     "pluralize",
     "set_current_locale",
-    "translate"
+    "translate",
+    "translate_for"
 ]
 
 LOG:Final[logging.Logger] = logging.getLogger(__name__)
@@ -95,7 +96,18 @@ def translate(text:object, caller: inspect.FrameInfo | None) -> str:
     text = str(text)
     if not caller:
         return text
+    return translate_for(text, caller.frame.f_globals.get('__name__'), caller.filename, caller.function)
 
+
+@functools.lru_cache(maxsize = 4096)
+def translate_for(text:str, module_name:str | None, file_path:str, function_name:str) -> str:
+    """
+    Translates the given text as if it was issued by the given function,
+    e.g. based on the caller information of a log record.
+
+    Results are cached since the same messages are translated over and over again.
+    The cache is cleared when the language changes.
+    """
     global _TRANSLATIONS
     if _TRANSLATIONS is None:
         try:
@@ -106,14 +118,13 @@ def translate(text:object, caller: inspect.FrameInfo | None) -> str:
     if not _TRANSLATIONS:
         return text
 
-    module_name = caller.frame.f_globals.get('__name__')  # pylint: disable=redefined-outer-name
-    file_basename = os.path.splitext(os.path.basename(caller.filename))[0]
+    file_basename = os.path.splitext(os.path.basename(file_path))[0]
     if module_name and module_name.endswith(f".{file_basename}"):
         module_name = module_name[:-(len(file_basename) + 1)]
     file_key = f"{file_basename}.py" if module_name == file_basename else f"{module_name}/{file_basename}.py"
     translation = dicts.safe_get(_TRANSLATIONS,
         file_key,
-        caller.function,
+        function_name,
         text
     )
     return translation if translation else text
@@ -139,6 +150,7 @@ def set_current_locale(new_locale:Locale) -> None:
     global _CURRENT_LOCALE, _TRANSLATIONS
     if new_locale.language != _CURRENT_LOCALE.language:
         _TRANSLATIONS = None
+        translate_for.cache_clear()
     _CURRENT_LOCALE = new_locale
 
 
@@ -3,11 +3,13 @@ SPDX-FileCopyrightText: © Sebastian Thomschke and contributors
 SPDX-License-Identifier: AGPL-3.0-or-later
 SPDX-ArtifactOfProjectHomePage: https://github.com/Second-Hand-Friends/kleinanzeigen-bot/
 """
-import copy, logging, re, sys
+import io, logging, os, re, sys, threading, time, traceback
+from collections.abc import Callable
 from gettext import gettext as _
 from logging import Logger, DEBUG, INFO, WARNING, ERROR, CRITICAL
-from logging.handlers import RotatingFileHandler
-from typing import Any, Final  # @UnusedImport
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Empty, SimpleQueue
+from typing import Any, BinaryIO, Final, cast  # @UnusedImport
 
 import colorama
 from . import i18n, reflect
@@ -26,77 +28,266 @@ __all__ = [
 
 LOG_ROOT:Final[logging.Logger] = logging.getLogger()
 
+# matches message values enclosed by [...], "...", and '...'
+_VALUE_HIGHLIGHT_RE:Final[re.Pattern[str]] = re.compile(r"\[([^\]]+)\]|\"([^\"]+)\"|\'([^\']+)\'")
 
-def configure_console_logging() -> None:
 
-    class CustomFormatter(logging.Formatter):
-        LEVEL_COLORS = {
-            DEBUG: colorama.Fore.BLACK + colorama.Style.BRIGHT,
-            INFO: colorama.Fore.BLACK + colorama.Style.BRIGHT,
-            WARNING: colorama.Fore.YELLOW,
-            ERROR: colorama.Fore.RED,
-            CRITICAL: colorama.Fore.RED,
-        }
-        MESSAGE_COLORS = {
-            DEBUG: colorama.Fore.BLACK + colorama.Style.BRIGHT,
-            INFO: colorama.Fore.RESET,
-            WARNING: colorama.Fore.YELLOW,
-            ERROR: colorama.Fore.RED,
-            CRITICAL: colorama.Fore.RED + colorama.Style.BRIGHT,
-        }
-        VALUE_COLORS = {
-            DEBUG: colorama.Fore.BLACK + colorama.Style.BRIGHT,
-            INFO: colorama.Fore.MAGENTA,
-            WARNING: colorama.Fore.MAGENTA,
-            ERROR: colorama.Fore.MAGENTA,
-            CRITICAL: colorama.Fore.MAGENTA,
-        }
-
-        def format(self, record:logging.LogRecord) -> str:
-            record = copy.deepcopy(record)
-
-            level_color = self.LEVEL_COLORS.get(record.levelno, "")
-            msg_color = self.MESSAGE_COLORS.get(record.levelno, "")
-            value_color = self.VALUE_COLORS.get(record.levelno, "")
-
-            # translate and colorize log level name
-            levelname = _(record.levelname) if record.levelno > DEBUG else record.levelname
-            record.levelname = f"{level_color}[{levelname}]{colorama.Style.RESET_ALL}"
+def _value_highlighter(prefix:str, suffix:str) -> Callable[[re.Match[str]], str]:
+    """
+    Returns a replacement function for _VALUE_HIGHLIGHT_RE that re-encloses the matched value with the given prefix and suffix.
+    """
+    # exactly one of the three alternative groups participates in a match, and it is always the last one matched
+    return lambda match: f"{prefix}{match[match.lastindex or 0]}{suffix}"
+
+
+_TRANSLATED_LEVELNAMES:Final[dict[tuple[i18n.Locale, str], str]] = {}
+
+
+class _TranslatingFilter(logging.Filter):
+    """
+    Translates the message of non-debug log records based on the module and function that issued them.
+    """
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        # debug messages should not be translated, and the record may be shared by multiple handlers.
+        # Non-string messages, e.g. exceptions, never have translations and are skipped before doing any work.
+        if record.levelno != DEBUG and isinstance(record.msg, str) and not getattr(record, "translated", False):
+            # filters run synchronously within the logging call, so a lambda issuing the record is still on the stack.
+            # Its messages are keyed by the function calling the lambda, same as for gettext and pluralize().
+            if record.funcName == "<lambda>" and (caller := reflect.get_lambda_caller(record.pathname, record.lineno)):
+                record.msg = i18n.translate(record.msg, caller)
+            else:
+                # loggers are named after the module they are used in, i.e. get_logger(__name__)
+                record.msg = i18n.translate_for(record.msg, record.name, record.pathname, record.funcName)
+            record.translated = True
+        return True
 
-            # highlight message values enclosed by [...], "...", and '...'
-            record.msg = re.sub(
-                r"\[([^\]]+)\]|\"([^\"]+)\"|\'([^\']+)\'",
-                lambda match: f"[{value_color}{match.group(1) or match.group(2) or match.group(3)}{colorama.Fore.RESET}{msg_color}]",
-                str(record.msg),
-            )
 
-            # colorize message
-            record.msg = f"{msg_color}{record.msg}{colorama.Style.RESET_ALL}"
+_TRANSLATING_FILTER:Final[_TranslatingFilter] = _TranslatingFilter()
 
+
+class _CustomFormatter(logging.Formatter):
+    """
+    Formats console log records with a translated level name and, if enabled, ANSI colors highlighting the message values.
+    """
+
+    # (level name color, message color, value highlighter) per log level,
+    # precomputed once so formatting a record only needs a single lookup
+    FORMAT_TABLE:Final[dict[int, tuple[str, str, Callable[[re.Match[str]], str]]]] = {
+        level: (level_color, msg_color, _value_highlighter(f"[{value_color}", f"{colorama.Fore.RESET}{msg_color}]"))
+        for level, level_color, msg_color, value_color in (
+            (DEBUG, colorama.Fore.BLACK + colorama.Style.BRIGHT, colorama.Fore.BLACK + colorama.Style.BRIGHT,
+             colorama.Fore.BLACK + colorama.Style.BRIGHT),
+            (INFO, colorama.Fore.BLACK + colorama.Style.BRIGHT, colorama.Fore.RESET, colorama.Fore.MAGENTA),
+            (WARNING, colorama.Fore.YELLOW, colorama.Fore.YELLOW, colorama.Fore.MAGENTA),
+            (ERROR, colorama.Fore.RED, colorama.Fore.RED, colorama.Fore.MAGENTA),
+            (CRITICAL, colorama.Fore.RED, colorama.Fore.RED + colorama.Style.BRIGHT, colorama.Fore.MAGENTA),
+        )
+    }
+    DEFAULT_FORMAT:Final[tuple[str, str, Callable[[re.Match[str]], str]]] = ("", "", _value_highlighter("[", f"{colorama.Fore.RESET}]"))
+
+    def __init__(self, fmt:str, colorize:bool = True) -> None:
+        super().__init__(fmt)
+        self.colorize = colorize
+
+    def format(self, record:logging.LogRecord) -> str:
+        # translate log level name, translations are cached per locale as there are only a handful of level names
+        levelname = record.levelname
+        if record.levelno > DEBUG:
+            cache_key = (i18n.get_current_locale(), levelname)
+            if (translated_levelname := _TRANSLATED_LEVELNAMES.get(cache_key)) is None:
+                translated_levelname = _TRANSLATED_LEVELNAMES[cache_key] = _(levelname)
+            levelname = translated_levelname
+
+        msg:object = record.msg
+        if self.colorize:
+            level_color, msg_color, value_highlighter = self.FORMAT_TABLE.get(record.levelno, self.DEFAULT_FORMAT)
+
+            # highlight message values enclosed by [...], "...", and '...'
+            if not isinstance(msg, str):  # messages are almost always strings already
+                msg = str(msg)
+            if "[" in msg or '"' in msg or "'" in msg:  # skip the regex scan for messages without any value delimiters
+                msg = _VALUE_HIGHLIGHT_RE.sub(value_highlighter, msg)
+
+            levelname = f"{level_color}[{levelname}]{colorama.Style.RESET_ALL}"
+            msg = f"{msg_color}{msg}{colorama.Style.RESET_ALL}"
+        else:
+            levelname = f"[{levelname}]"
+
+        # temporarily swap in the formatted values since the record is shared with other handlers (e.g. the file logger)
+        orig_levelname, orig_msg = record.levelname, record.msg
+        record.levelname, record.msg = levelname, msg
+        try:
             return super().format(record)
+        finally:
+            record.levelname, record.msg = orig_levelname, orig_msg
 
-    formatter = CustomFormatter("%(levelname)s %(message)s")
 
-    stdout_log = logging.StreamHandler(sys.stderr)
-    stdout_log.setLevel(DEBUG)
-    stdout_log.addFilter(type("", (logging.Filter,), {
-        "filter": lambda rec: rec.levelno <= INFO
-    }))
-    stdout_log.setFormatter(formatter)
-    LOG_ROOT.addHandler(stdout_log)
+def configure_console_logging() -> None:
+    # only emit ANSI color codes when writing to a terminal, see also https://no-color.org/
+    colorize = sys.stderr.isatty() and not os.environ.get("NO_COLOR")
+    formatter = _CustomFormatter("%(levelname)s %(message)s", colorize = colorize)
+
+    # all levels go to stderr, so a single handler suffices and each record passes through just one handler
+    console_log = logging.StreamHandler(sys.stderr)
+    console_log.setLevel(DEBUG)
+    console_log.addFilter(_TRANSLATING_FILTER)
+    console_log.setFormatter(formatter)
+    LOG_ROOT.addHandler(console_log)
 
-    stderr_log = logging.StreamHandler(sys.stderr)
-    stderr_log.setLevel(WARNING)
-    stderr_log.setFormatter(formatter)
-    LOG_ROOT.addHandler(stderr_log)
+
+class _BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    A RotatingFileHandler which writes the log records through a large buffer instead of flushing the file after every record.
+
+    Buffered data is written to disk on flush(), on rollover, and on close().
+    The size of the log file is tracked in memory, so checking whether a rollover is due costs no system call.
+    """
+
+    def __init__(self, *args:Any, buffer_size:int = 1024 * 1024, **kwargs:Any) -> None:
+        self.buffer_size = buffer_size
+        self._rotatable = True
+        self._file_size = 0
+        super().__init__(*args, **kwargs)
+
+    def _open(self) -> BinaryIO:  # type: ignore[override]
+        stream = io.BufferedWriter(io.FileIO(self.baseFilename, self.mode), buffer_size = self.buffer_size)
+        # see bpo-45401: never rollover anything other than regular files, e.g. /dev/null
+        self._rotatable = os.path.isfile(self.baseFilename)
+        # the bot is the only writer of the log file, so the file size is tracked in memory
+        # instead of querying the file position for every record
+        self._file_size = stream.tell()
+        return stream
+
+    def emit(self, record:logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            if os.linesep != "\n":
+                msg = msg.replace("\n", os.linesep)
+            data = msg.encode(self.encoding or "utf-8", self.errors or "strict")
+
+            if self.stream is None:
+                # do not silently reopen (and leak) the file for records arriving after close()
+                if self._closed:  # type: ignore[attr-defined]
+                    return
+                self.stream = self._open()  # type: ignore[assignment]
+            if self._rotatable and 0 < self.maxBytes <= self._file_size + len(data):
+                self.doRollover()
+            cast(BinaryIO, self.stream).write(data)
+            self._file_size += len(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class _FlushRequest(logging.LogRecord):
+    """
+    Queue marker asking the listener to flush its handlers once all records enqueued before it have been handled.
+    """
+
+    def __init__(self) -> None:
+        super().__init__("", DEBUG, "", 0, "", None, None)
+        self.done = threading.Event()
+
+
+class _BatchingQueueListener(QueueListener):
+    """
+    A QueueListener which flushes its handlers at most `flush_interval` seconds after a record was handled,
+    so buffered handlers write all records of that time window in one go but never hold back records for long.
+    """
+
+    queue:SimpleQueue[logging.LogRecord]
+
+    def __init__(self, q:SimpleQueue[logging.LogRecord], *handlers:logging.Handler, respect_handler_level:bool = False,
+                 flush_interval:float = 0.1) -> None:
+        super().__init__(q, *handlers, respect_handler_level = respect_handler_level)
+        self.flush_interval = flush_interval
+        self._flush_deadline:float | None = None
+
+    def _flush_handlers(self) -> None:
+        self._flush_deadline = None
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:  # pylint: disable=broad-exception-caught
+                # report like Handler.handleError() does, an exception escaping here would end the listener thread
+                # and all further records would silently pile up in the queue
+                if logging.raiseExceptions and sys.stderr:
+                    sys.stderr.write(f"--- Logging error ---\nFailed to flush {handler!r}\n")
+                    traceback.print_exc(file = sys.stderr)
+
+    def dequeue(self, block:bool) -> logging.LogRecord:
+        if block and self._flush_deadline is not None:
+            timeout = self._flush_deadline - time.monotonic()
+            if timeout > 0:
+                try:
+                    return self.queue.get(timeout = timeout)
+                except Empty:
+                    pass
+            self._flush_handlers()
+        return self.queue.get(block)
+
+    def handle(self, record:logging.LogRecord) -> None:
+        if isinstance(record, _FlushRequest):
+            self._flush_handlers()
+            record.done.set()
+            return
+        super().handle(record)
+        if self._flush_deadline is None:
+            self._flush_deadline = time.monotonic() + self.flush_interval
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+class _QueueingFileHandler(QueueHandler):
+    """
+    Hands log records over to a background thread which writes them to the wrapped file handler,
+    so logging calls do not block on disk I/O.
+    """
+
+    queue:SimpleQueue[logging.LogRecord]
+
+    def __init__(self, file_handler:logging.Handler) -> None:
+        # SimpleQueue.put() is reentrant, unlike Queue.put() which holds a lock, so logging from
+        # a signal handler (e.g. error_handlers.on_sigint) while the main thread is enqueuing cannot deadlock
+        super().__init__(SimpleQueue())
+        self.file_handler = file_handler
+        self._listener:_BatchingQueueListener | None = _BatchingQueueListener(self.queue, file_handler, respect_handler_level = True)
+        self._listener.start()
+
+    def flush(self) -> None:
+        """Blocks until all queued log records have been written."""
+        listener = self._listener
+        if listener:
+            flush_request = _FlushRequest()
+            self.queue.put(flush_request)
+            # the request remains unanswered if the listener was stopped by a concurrent close() before picking it up
+            while not flush_request.done.wait(0.1):
+                if not listener.is_alive():
+                    break
+            else:
+                return
+        self.file_handler.flush()
+
+    def close(self) -> None:
+        """Writes all queued log records, stops the background thread, and closes the wrapped file handler."""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+        self.file_handler.close()
+        super().close()
 
 
 class LogFileHandle:
     """Encapsulates a log file handler with close and status methods."""
 
-    def __init__(self, file_path: str, handler: RotatingFileHandler, logger: logging.Logger):
+    __slots__ = ("file_path", "_handler", "_logger")
+
+    def __init__(self, file_path: str, handler: logging.Handler, logger: logging.Logger):
         self.file_path = file_path
-        self._handler:RotatingFileHandler | None = handler
+        self._handler:logging.Handler | None = handler
         self._logger = logger
 
     def close(self) -> None:
@@ -114,12 +305,15 @@ class LogFileHandle:
 
 def configure_file_logging(log_file_path:str) -> LogFileHandle:
     """
-    Sets up a file logger and returns a callable to flush, remove, and close it.
+    Sets up a file logger and returns a handle to flush, remove, and close it.
+
+    Logging calls only enqueue the records. A background thread writes them through a 1 MB buffer
+    which is flushed in batches at most 100 ms after a record was written, so logging never blocks on disk I/O.
 
     @param log_file_path: Path to the log file.
-    @return: Callable[[], None]: A function that cleans up the log handler.
+    @return: LogFileHandle: A handle to clean up the log handler.
     """
-    fh = RotatingFileHandler(
+    fh = _BufferedRotatingFileHandler(
         filename = log_file_path,
         maxBytes = 10 * 1024 * 1024,  # 10 MB
         backupCount = 10,
@@ -127,8 +321,11 @@ def configure_file_logging(log_file_path:str) -> LogFileHandle:
     )
     fh.setLevel(DEBUG)
     fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-    LOG_ROOT.addHandler(fh)
-    return LogFileHandle(log_file_path, fh, LOG_ROOT)
+    qh = _QueueingFileHandler(fh)
+    qh.setLevel(DEBUG)
+    qh.addFilter(_TRANSLATING_FILTER)
+    LOG_ROOT.addHandler(qh)
+    return LogFileHandle(log_file_path, qh, LOG_ROOT)
 
 
 def flush_all_handlers() -> None:
@@ -138,17 +335,12 @@ def flush_all_handlers() -> None:
 
 def get_logger(name: str | None = None) -> logging.Logger:
     """
-    Returns a localized logger
-    """
-
-    class TranslatingLogger(logging.Logger):
+    Returns a logger whose messages get localized by the handlers set up via configure_console_logging() and configure_file_logging()
 
-        def _log(self, level: int, msg: object, *args: Any, **kwargs: Any) -> None:
-            if level != DEBUG:  # debug messages should not be translated
-                msg = i18n.translate(msg, reflect.get_caller(2))
-            super()._log(level, msg, *args, **kwargs)
-
-    logging.setLoggerClass(TranslatingLogger)
+    Pass message arguments separately, e.g. `LOG.info("Saving [%s]...", path)` instead of `LOG.info(f"Saving [{path}]...")`.
+    This way the message template can be looked up in the translations and the arguments are only
+    formatted if the record is actually emitted. Expensive debug output should be guarded by `is_debug()`.
+    """
     return logging.getLogger(name)
 
 
@@ -3,19 +3,49 @@ SPDX-FileCopyrightText: © Sebastian Thomschke and contributors
 SPDX-License-Identifier: AGPL-3.0-or-later
 SPDX-ArtifactOfProjectHomePage: https://github.com/Second-Hand-Friends/kleinanzeigen-bot/
 """
-import inspect
+import inspect, os
+from types import FrameType
 from typing import Any
 
 
 def get_caller(depth: int = 1) -> inspect.FrameInfo | None:
-    stack = inspect.stack()
+    """
+    Returns the first non-lambda frame at or above the given depth relative to the caller of this function.
+
+    Walks the frame chain directly instead of using inspect.stack(), which would
+    resolve source files and load source code lines for every frame on the stack.
+    """
+    frame = inspect.currentframe()
     try:
-        for frame in stack[depth + 1:]:
-            if frame.function and frame.function != "<lambda>":
-                return frame
-        return None
+        for _ in range(depth + 1):
+            frame = frame.f_back if frame else None
+        return _first_non_lambda_frame(frame)
     finally:
-        del stack  # Clean up the stack to avoid reference cycles
+        del frame  # Clean up the frame reference to avoid reference cycles
+
+
+def get_lambda_caller(filename:str, lineno:int) -> inspect.FrameInfo | None:
+    """
+    Returns the first non-lambda frame above the lambda at the given source location,
+    provided the lambda is currently executing on the stack of the calling thread.
+    """
+    filename = os.path.normcase(filename)
+    frame = inspect.currentframe()
+    try:
+        while frame and not (frame.f_code.co_name == "<lambda>" and frame.f_lineno == lineno
+                             and os.path.normcase(frame.f_code.co_filename) == filename):
+            frame = frame.f_back
+        return _first_non_lambda_frame(frame)
+    finally:
+        del frame  # Clean up the frame reference to avoid reference cycles
+
+
+def _first_non_lambda_frame(frame:FrameType | None) -> inspect.FrameInfo | None:
+    while frame and frame.f_code.co_name == "<lambda>":
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return inspect.FrameInfo(frame, frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name, None, None)
 
 
 def is_integer(obj:Any) -> bool:
@@ -56,3 +56,22 @@ def test_pluralize(
 
     result = i18n.pluralize(noun, count, prefix_with_count)
     assert result == expected, f"For LANG={lang}, expected {expected} but got {result}"
+
+
+def test_translate_for() -> None:
+    """Cached translations must not leak across language changes."""
+    def translate() -> str:
+        return i18n.translate_for("DONE: No configuration errors found.", "kleinanzeigen_bot", "/path/to/kleinanzeigen_bot/__init__.py", "run")
+
+    original_locale = i18n.get_current_locale()
+    try:
+        i18n.set_current_locale(i18n.Locale("de", "DE", "UTF-8"))
+        assert translate() == "FERTIG: Keine Konfigurationsfehler gefunden."
+
+        i18n.set_current_locale(i18n.Locale("en", "US", "UTF-8"))
+        assert translate() == "DONE: No configuration errors found."
+
+        i18n.set_current_locale(i18n.Locale("de", "DE", "UTF-8"))
+        assert translate() == "FERTIG: Keine Konfigurationsfehler gefunden."
+    finally:
+        i18n.set_current_locale(original_locale)
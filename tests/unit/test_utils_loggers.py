@@ -0,0 +1,283 @@
+"""
+SPDX-FileCopyrightText: © Sebastian Thomschke and contributors
+SPDX-License-Identifier: AGPL-3.0-or-later
+SPDX-ArtifactOfProjectHomePage: https://github.com/Second-Hand-Friends/kleinanzeigen-bot/
+"""
+import logging, os, threading, time
+from logging.handlers import RotatingFileHandler
+
+import colorama
+import pytest
+from kleinanzeigen_bot.utils import i18n, loggers
+
+
+def _make_record(level:int, msg:object, *args:object) -> logging.LogRecord:
+    return logging.LogRecord("kleinanzeigen_bot.test", level, __file__, 1, msg, args, None)
+
+
+@pytest.fixture(autouse = True)
+def english_locale() -> None:
+    i18n.set_current_locale(i18n.Locale("en", "US", "UTF-8"))
+
+
+@pytest.mark.parametrize("msg, expected", [
+    ("Nothing to highlight", "Nothing to highlight"),
+    ("Loading [config.yaml]...", "Loading [<config.yaml>]..."),
+    ("Publishing ad 'Test Ad' with \"Test Title\"", "Publishing ad [<Test Ad>] with [<Test Title>]"),
+    ("Empty values [] \"\" stay", "Empty values [] \"\" stay"),
+    ("Unclosed [value", "Unclosed [value"),
+])
+def test_value_highlight(msg:str, expected:str) -> None:
+    highlighter = loggers._value_highlighter("[<", ">]")  # pylint: disable=protected-access
+    assert loggers._VALUE_HIGHLIGHT_RE.sub(highlighter, msg) == expected  # pylint: disable=protected-access
+
+
+def test_custom_formatter_plain() -> None:
+    formatter = loggers._CustomFormatter("%(levelname)s %(message)s", colorize = False)  # pylint: disable=protected-access
+
+    assert formatter.format(_make_record(loggers.INFO, "Saving [%s]...", "ad.yaml")) == "[INFO] Saving [ad.yaml]..."
+    assert formatter.format(_make_record(logging.WARNING, "Something is off")) == "[WARNING] Something is off"
+
+
+def test_custom_formatter_colorized() -> None:
+    formatter = loggers._CustomFormatter("%(levelname)s %(message)s", colorize = True)  # pylint: disable=protected-access
+
+    result = formatter.format(_make_record(logging.ERROR, "Failed to open [%s]", "ad.yaml"))
+    assert result == (
+        f"{colorama.Fore.RED}[ERROR]{colorama.Style.RESET_ALL} "
+        f"{colorama.Fore.RED}Failed to open [{colorama.Fore.MAGENTA}ad.yaml{colorama.Fore.RESET}{colorama.Fore.RED}]{colorama.Style.RESET_ALL}"
+    )
+
+
+@pytest.mark.parametrize("colorize", [True, False])
+def test_custom_formatter_does_not_modify_record(colorize:bool) -> None:
+    """The record is shared with the other handlers, e.g. the file logger, and must be left untouched."""
+    formatter = loggers._CustomFormatter("%(levelname)s %(message)s", colorize = colorize)  # pylint: disable=protected-access
+    record = _make_record(logging.WARNING, "Value is [%s]", 42)
+
+    formatter.format(record)
+
+    assert record.levelname == "WARNING"
+    assert record.msg == "Value is [%s]"
+    assert record.getMessage() == "Value is [42]"
+
+
+def _create_buffered_file_handler(log_file_path:str, max_bytes:int, backup_count:int) -> RotatingFileHandler:
+    handler = loggers._BufferedRotatingFileHandler(  # pylint: disable=protected-access
+        filename = log_file_path, maxBytes = max_bytes, backupCount = backup_count, encoding = "utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+def test_buffered_file_handler_rollover(log_file_path:str) -> None:
+    record_size = 9 + len(os.linesep)
+    handler = _create_buffered_file_handler(log_file_path, max_bytes = 2 * record_size + 1, backup_count = 2)
+    for i in range(7):
+        handler.emit(_make_record(loggers.INFO, f"record {i:02d}"))
+    handler.close()
+
+    # records 0-1 were rotated out, 2-3 and 4-5 are in the backups, 6 is in the current file
+    assert sorted(os.listdir(os.path.dirname(log_file_path))) == ["test.log", "test.log.1", "test.log.2"]
+    assert os.path.getsize(log_file_path) == record_size
+    assert os.path.getsize(f"{log_file_path}.1") == 2 * record_size
+    assert os.path.getsize(f"{log_file_path}.2") == 2 * record_size
+    with open(f"{log_file_path}.2", encoding = "utf-8") as file:
+        assert file.read().split() == ["record", "02", "record", "03"]
+
+
+def test_buffered_file_handler_rollover_of_existing_file(log_file_path:str) -> None:
+    with open(log_file_path, "w", encoding = "utf-8") as file:
+        file.write("x" * 20)
+
+    # the size of the existing file must be taken into account
+    handler = _create_buffered_file_handler(log_file_path, max_bytes = 25, backup_count = 1)
+    handler.emit(_make_record(loggers.INFO, "record 00"))
+    handler.close()
+
+    assert os.path.getsize(f"{log_file_path}.1") == 20
+    assert os.path.getsize(log_file_path) == 9 + len(os.linesep)
+
+
+def test_buffered_file_handler_ignores_records_after_close(log_file_path:str) -> None:
+    handler = _create_buffered_file_handler(log_file_path, max_bytes = 0, backup_count = 0)
+    handler.emit(_make_record(loggers.INFO, "before close"))
+    handler.close()
+
+    handler.emit(_make_record(loggers.INFO, "after close"))
+
+    assert handler.stream is None
+    with open(log_file_path, "rb") as file:
+        assert file.read() == f"before close{os.linesep}".encode()
+
+
+class _RecordingHandler(logging.Handler):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records:list[logging.LogRecord] = []
+
+    def emit(self, record:logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def _make_bot_run_record(level:int) -> logging.LogRecord:
+    """Creates a record as if logged by KleinanzeigenBot.run() in kleinanzeigen_bot/__init__.py"""
+    return logging.LogRecord("kleinanzeigen_bot", level, "/path/to/kleinanzeigen_bot/__init__.py", 1,
+        "DONE: No configuration errors found.", None, None, func = "run")
+
+
+def test_translating_filter() -> None:
+    i18n.set_current_locale(i18n.Locale("de", "DE", "UTF-8"))
+
+    record = _make_bot_run_record(loggers.INFO)
+    assert loggers._TRANSLATING_FILTER.filter(record)  # pylint: disable=protected-access
+    assert record.getMessage() == "FERTIG: Keine Konfigurationsfehler gefunden."
+
+
+def test_translating_filter_skips_debug_records() -> None:
+    i18n.set_current_locale(i18n.Locale("de", "DE", "UTF-8"))
+
+    record = _make_bot_run_record(loggers.DEBUG)
+    assert loggers._TRANSLATING_FILTER.filter(record)  # pylint: disable=protected-access
+    assert record.getMessage() == "DONE: No configuration errors found."
+
+
+def test_translating_filter_translates_once(monkeypatch:pytest.MonkeyPatch) -> None:
+    """A record passing through multiple handlers must only be translated once."""
+    calls:list[str] = []
+
+    def translate_for(text:str, *_:str | None) -> str:
+        calls.append(text)
+        return f"translated {text}"
+
+    monkeypatch.setattr(i18n, "translate_for", translate_for)
+
+    logger = logging.getLogger("kleinanzeigen_bot.test_translating_filter")
+    logger.propagate = False
+    logger.setLevel(loggers.INFO)
+    handlers = [_RecordingHandler(), _RecordingHandler()]
+    for handler in handlers:
+        handler.addFilter(loggers._TRANSLATING_FILTER)  # pylint: disable=protected-access
+        logger.addHandler(handler)
+    try:
+        logger.handle(_make_record(loggers.INFO, "Some message"))
+    finally:
+        for handler in handlers:
+            logger.removeHandler(handler)
+
+    assert calls == ["Some message"]
+    assert [r.getMessage() for handler in handlers for r in handler.records] == ["translated Some message"] * 2
+
+
+def test_translating_filter_resolves_caller_of_lambda(monkeypatch:pytest.MonkeyPatch) -> None:
+    """Messages logged inside a lambda are keyed by the function calling the lambda."""
+    function_names:list[str] = []
+
+    def translate_for(text:str, _module_name:str | None, _file_path:str, function_name:str) -> str:
+        function_names.append(function_name)
+        return text
+
+    monkeypatch.setattr(i18n, "translate_for", translate_for)
+
+    logger = logging.getLogger("kleinanzeigen_bot.test_translating_filter_lambda")
+    logger.propagate = False
+    logger.setLevel(loggers.INFO)
+    handler = _RecordingHandler()
+    handler.addFilter(loggers._TRANSLATING_FILTER)  # pylint: disable=protected-access
+    logger.addHandler(handler)
+    try:
+        (lambda: logger.info("Message from lambda"))()  # pylint: disable=unnecessary-direct-lambda-call
+    finally:
+        logger.removeHandler(handler)
+
+    assert handler.records[0].funcName == "<lambda>"
+    assert function_names == ["test_translating_filter_resolves_caller_of_lambda"]
+
+
+def _read_log_file(log_file_path:str) -> str:
+    with open(log_file_path, encoding = "utf-8") as file:
+        return file.read()
+
+
+def test_file_logging_flushes_without_explicit_flush(log_file_path:str) -> None:
+    log_file = loggers.configure_file_logging(log_file_path)
+    try:
+        loggers.get_logger("kleinanzeigen_bot.test").info("Written by the background thread")
+
+        # the listener flushes its batch ~100 ms after the last record, allow for slow CI machines
+        deadline = time.monotonic() + 2
+        while "Written by the background thread" not in _read_log_file(log_file_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert "Written by the background thread" in _read_log_file(log_file_path)
+    finally:
+        log_file.close()
+
+
+def test_file_logging_close_writes_queued_records(log_file_path:str) -> None:
+    log_file = loggers.configure_file_logging(log_file_path)
+    handler = log_file._handler  # pylint: disable=protected-access
+    assert isinstance(handler, loggers._QueueingFileHandler)  # pylint: disable=protected-access
+    assert handler._listener  # pylint: disable=protected-access
+    listener_thread = handler._listener._thread  # pylint: disable=protected-access
+    assert listener_thread is not None and listener_thread.is_alive()
+
+    logger = loggers.get_logger("kleinanzeigen_bot.test")
+    for i in range(100):
+        logger.info("record %02d", i)
+    try:
+        raise ValueError("Broken")
+    except ValueError:
+        logger.exception("Something failed")
+    log_file.close()
+
+    assert log_file.is_closed()
+    assert not listener_thread.is_alive()
+    assert handler not in loggers.LOG_ROOT.handlers
+    content = _read_log_file(log_file_path)
+    assert all(f"record {i:02d}" in content for i in range(100))
+    assert "Something failed" in content
+    assert "Traceback (most recent call last)" in content
+    assert 'raise ValueError("Broken")' in content
+
+
+class _FailingFlushHandler(_RecordingHandler):
+
+    def flush(self) -> None:
+        raise OSError(28, "No space left on device")
+
+
+def test_file_logging_survives_flush_errors(capsys:pytest.CaptureFixture[str]) -> None:
+    failing_handler = _FailingFlushHandler()
+    handler = loggers._QueueingFileHandler(failing_handler)  # pylint: disable=protected-access
+    assert handler._listener  # pylint: disable=protected-access
+    listener_thread = handler._listener._thread  # pylint: disable=protected-access
+    try:
+        handler.handle(_make_record(loggers.INFO, "before flush error"))
+        handler.flush()
+        handler.handle(_make_record(loggers.INFO, "after flush error"))
+        handler.flush()
+
+        assert listener_thread is not None and listener_thread.is_alive()
+    finally:
+        handler.close()
+
+    assert [record.getMessage() for record in failing_handler.records] == ["before flush error", "after flush error"]
+    assert "No space left on device" in capsys.readouterr().err
+
+
+def test_file_logging_flush_does_not_wait_for_stopped_listener() -> None:
+    """A flush racing with close() must not wait forever for a listener which already stopped."""
+    recording_handler = _RecordingHandler()
+    handler = loggers._QueueingFileHandler(recording_handler)  # pylint: disable=protected-access
+    listener = handler._listener  # pylint: disable=protected-access
+    assert listener and listener._thread  # pylint: disable=protected-access
+    # let the listener thread end as if close() had enqueued its stop sentinel just before the flush request
+    listener.enqueue_sentinel()
+    listener._thread.join()  # pylint: disable=protected-access
+    try:
+        flush_thread = threading.Thread(target = handler.flush, daemon = True)
+        flush_thread.start()
+        flush_thread.join(timeout = 5)
+        assert not flush_thread.is_alive()
+    finally:
+        handler.close()